@@ -2,11 +2,17 @@
 
 import logging
 from decimal import Decimal
+from typing import Iterator
 from xml.etree import ElementTree
 
 from ofxstatement.parser import StatementParser
 from ofxstatement.plugin import Plugin
-from ofxstatement.statement import StatementLine
+from ofxstatement.statement import Statement, StatementLine
+from ofxstatement.plugins.reconcileLV import (
+    BalanceReconciler,
+    from_settings,
+    iter_fidavista,
+)
 
 
 class CitadeleLVStatementParser(StatementParser[ElementTree.Element]):
@@ -14,63 +20,76 @@ class CitadeleLVStatementParser(StatementParser[ElementTree.Element]):
 
     filename: str | None
     debug: bool
+    reconciler: BalanceReconciler
 
     def __init__(self, filename: str):
         super().__init__()
 
         self.filename = filename
         self.debug = logging.getLogger().getEffectiveLevel() == logging.DEBUG
+        self.reconciler = BalanceReconciler()
 
-    def split_records(self) -> list[ElementTree.Element]:
-        assert self.filename is not None, "No input file provided"
+    def parse(self) -> Statement:
+        statement = super().parse()
+        self.reconciler.check(self.statement.end_balance, self.cur_record)
+        self.reconciler.finish()
+        return statement
 
-        xml = ElementTree.parse(self.filename)
-        xml = xml.getroot()
+    def split_records(self) -> Iterator[ElementTree.Element]:
+        assert self.filename is not None, "No input file provided"
 
-        # Namespace stuff
-        namespaces = {"ns": xml.tag[1:].partition("}")[0]}
-        statement = xml.find("ns:Statement", namespaces=namespaces)
-        if statement is None:
-            raise Exception("No statement found in XML")
-
-        # Find the period
-        period = statement.find("ns:Period", namespaces=namespaces)
-        if period is not None:
-            start_date = period.find("ns:StartDate", namespaces=namespaces)
-            if start_date is not None and start_date.text is not None:
-                self.statement.start_date = self.parse_datetime(start_date.text)
-
-            end_date = period.find("ns:EndDate", namespaces=namespaces)
-            if end_date is not None and end_date.text is not None:
-                self.statement.end_date = self.parse_datetime(end_date.text)
-
-        # Find the account
-        account = statement.find("ns:AccountSet", namespaces=namespaces)
-        if account is None:
+        # Records covered by the last checkpoint are skipped
+        skip = 0
+        checkpoint = self.reconciler.resume(self.statement, self.parse_float)
+        if checkpoint:
+            skip = self.cur_record = checkpoint["record"]
+
+        return self.reconciler.track(self, self.iter_transactions(self.filename, skip))
+
+    def iter_transactions(
+        self, filename: str, skip: int = 0
+    ) -> Iterator[ElementTree.Element]:
+        """Stream TrxSet elements, picking up statement details on the way"""
+        account_found = False
+        transactions_found = False
+
+        for key, element in iter_fidavista(filename, skip):
+            text = element.text
+
+            # Find the period
+            if key == "Statement/Period/StartDate":
+                if text is not None:
+                    self.statement.start_date = self.parse_datetime(text)
+            elif key == "Statement/Period/EndDate":
+                if text is not None:
+                    self.statement.end_date = self.parse_datetime(text)
+
+            # Find the account
+            elif key == "Statement/AccountSet":
+                account_found = True
+            elif key == "Statement/AccountSet/AccNo":
+                if not self.statement.account_id:
+                    self.statement.account_id = text
+
+            # Find the opening and closing balances which are stored in transactions
+            elif key == "Statement/AccountSet/CcyStmt":
+                transactions_found = True
+            elif key == "Statement/AccountSet/CcyStmt/OpenBal":
+                if text is not None:
+                    self.statement.start_balance = Decimal(self.parse_float(text))
+                    self.reconciler.start(self.statement.start_balance)
+            elif key == "Statement/AccountSet/CcyStmt/CloseBal":
+                if text is not None:
+                    self.statement.end_balance = Decimal(self.parse_float(text))
+
+            # Transactions
+            elif key == "Statement/AccountSet/CcyStmt/TrxSet":
+                yield element
+
+        if not account_found:
             raise Exception("No account found in XML")
-
-        account_id = account.find("ns:AccNo", namespaces=namespaces)
-        if not self.statement.account_id and account_id is not None:
-            self.statement.account_id = account_id.text
-
-        # Find all transactions
-        transactions = account.find("ns:CcyStmt", namespaces=namespaces)
-        if transactions is None:
+        if not transactions_found:
             raise Exception("No transaction tag found in XML")
-        all_transactions = transactions.findall("ns:TrxSet", namespaces=namespaces)
-
-        # Find the opening and closing balances which are stored in transactions
-        opening_balance = transactions.find("ns:OpenBal", namespaces=namespaces)
-        if opening_balance is not None and opening_balance.text is not None:
-            self.statement.start_balance = Decimal(
-                self.parse_float(opening_balance.text)
-            )
-
-        closing_balance = transactions.find("ns:CloseBal", namespaces=namespaces)
-        if closing_balance is not None and closing_balance.text is not None:
-            self.statement.end_balance = Decimal(self.parse_float(closing_balance.text))
-
-        return all_transactions
 
     def parse_record(self, line: ElementTree.Element) -> StatementLine:
         # Namespace stuff
@@ -125,6 +144,8 @@ class CitadeleLVStatementParser(StatementParser[ElementTree.Element]):
             stmt_line.amount = -amount
             stmt_line.trntype = "DEBIT"
 
+        self.reconciler.add(self.cur_record, stmt_line)
+
         # Various types
         if type_code == "CHOU":
             stmt_line.trntype = "ATM"
@@ -157,4 +178,5 @@ class CitadeleLVPlugin(Plugin):
     def get_parser(self, filename: str) -> CitadeleLVStatementParser:
         parser = CitadeleLVStatementParser(filename)
         parser.statement.currency = self.settings.get("currency", "EUR")
+        parser.reconciler = from_settings(self.settings, filename)
         return parser
@@ -0,0 +1,413 @@
+"""Running balance reconciliation with resumable checkpoints
+
+Parsers feed every transaction through a BalanceReconciler, which keeps a
+running Decimal balance starting from the statement opening balance and
+compares it against every balance the statement reports (closing balance
+lines, CloseBal elements). The first record where the two diverge is logged
+and kept in `mismatch`.
+
+When a checkpoint file is configured, parsed lines are journaled to it as
+JSON lines and every `interval` records a checkpoint entry is written with the
+record index, input offset, running balance and last transaction id. An
+interrupted conversion of the same input file picks up from the last
+checkpoint instead of parsing everything again. The file is removed once the
+conversion finishes.
+
+FiDAViSta parsers stream the document with `iter_fidavista`, so neither a
+full nor a resumed conversion keeps the whole XML tree in memory.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Iterator, Mapping, TextIO, TypeVar
+from xml.etree import ElementTree
+
+from ofxstatement.parser import StatementParser
+from ofxstatement.statement import Statement, StatementLine
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_INTERVAL = 10000
+
+STATEMENT_FIELDS = ("account_id", "currency")
+STATEMENT_DECIMAL_FIELDS = ("start_balance", "end_balance")
+STATEMENT_DATE_FIELDS = ("start_date", "end_date")
+
+LINE_FIELDS = ("id", "memo", "payee", "trntype", "check_no")
+LINE_DECIMAL_FIELDS = ("amount",)
+LINE_DATE_FIELDS = ("date", "date_user")
+
+
+def to_decimal(value: Any) -> Decimal:
+    """Convert balances and amounts coming from parsers to Decimal, floats
+    going through str so they keep the value they were printed with"""
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def dump_fields(obj: Any, fields, decimal_fields, date_fields) -> dict:
+    data = {name: getattr(obj, name, None) for name in fields}
+    for name in decimal_fields:
+        value = getattr(obj, name, None)
+        data[name] = None if value is None else str(value)
+    for name in date_fields:
+        value = getattr(obj, name, None)
+        data[name] = None if value is None else value.isoformat()
+    return data
+
+
+def load_fields(
+    obj: Any,
+    data: dict,
+    fields,
+    decimal_fields,
+    date_fields,
+    parse_amount: Callable[[str], Any] = Decimal,
+) -> Any:
+    for name in fields:
+        setattr(obj, name, data.get(name))
+    for name in decimal_fields:
+        value = data.get(name)
+        setattr(obj, name, None if value is None else parse_amount(value))
+    for name in date_fields:
+        value = data.get(name)
+        setattr(obj, name, None if value is None else datetime.fromisoformat(value))
+    return obj
+
+
+def iter_fidavista(
+    source: Any, skip: int = 0
+) -> Iterator[tuple[str, ElementTree.Element]]:
+    """Stream FiDAViSta document, yielding (path, element) pairs, path being
+    relative to the root, e.g. "Statement/AccountSet/CcyStmt/TrxSet".
+
+    Only the first account and currency statement are yielded, and the first
+    `skip` TrxSet elements are passed over. Every element is freed once the
+    caller is done with it, elements inside TrxSet go away together with it.
+    """
+    found = False
+    count = 0
+    path: list[str] = []
+    elements: list[ElementTree.Element] = []
+    finished: set[str] = set()
+
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            path.append(element.tag.rpartition("}")[2])
+            elements.append(element)
+            if path[1:] == ["Statement"]:
+                found = True
+            continue
+
+        key = "/".join(path[1:])
+        if "TrxSet" not in path[:-1] and not any(
+            key.startswith(done + "/") for done in finished
+        ):
+            if key == "Statement/AccountSet/CcyStmt/TrxSet":
+                count += 1
+                if count > skip:
+                    yield key, element
+            else:
+                yield key, element
+
+            if key in ("Statement/AccountSet", "Statement/AccountSet/CcyStmt"):
+                finished.add(key)
+
+        # Done with this element, free the memory
+        if len(elements) > 1 and "TrxSet" not in path[:-1]:
+            elements[-2].remove(element)
+
+        path.pop()
+        elements.pop()
+
+    if not found:
+        raise ValueError("Cannot find ns:Statement element, is this Fidavista format?")
+
+
+class BalanceReconciler:
+    checkpoint_path: str | None
+    interval: int
+    source: dict | None
+
+    balance: Decimal | None
+    record: int
+    last_id: str | None
+    mismatch: dict | None
+
+    _journal: TextIO | None
+    _journaled: int
+    _checkpointed: int
+
+    def __init__(
+        self,
+        checkpoint_path: str | None = None,
+        interval: int = DEFAULT_INTERVAL,
+        source_path: str | None = None,
+    ):
+        self.checkpoint_path = checkpoint_path
+        self.interval = max(int(interval), 1)
+
+        # Identify the input, so a checkpoint is never applied to another file
+        self.source = None
+        if source_path is not None:
+            stat = os.stat(source_path)
+            self.source = {
+                "path": os.path.abspath(source_path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+
+        self.balance = None
+        self.record = 0
+        self.last_id = None
+        self.mismatch = None
+
+        self._journal = None
+        self._journaled = 0
+        self._checkpointed = 0
+
+    def start(self, balance: Any) -> None:
+        """Set the opening balance, unless it was restored from a checkpoint"""
+        if self.balance is None and balance is not None:
+            self.balance = to_decimal(balance)
+
+    def reset(self, balance: Any) -> None:
+        """Start a new statement block from its opening balance, None turns
+        reconciliation off until the next reset"""
+        self.balance = None if balance is None else to_decimal(balance)
+
+    def add(self, record: int, line: StatementLine) -> None:
+        """Add transaction amount to the running balance"""
+        self.record = record
+        self.last_id = line.id
+        if self.balance is not None and line.amount is not None:
+            self.balance += to_decimal(line.amount)
+
+    def check(self, balance: Any, record: int | None = None) -> bool:
+        """Compare running balance with a balance reported by the statement"""
+        if self.balance is None or balance is None:
+            return True
+
+        balance = to_decimal(balance)
+        if balance == self.balance:
+            return True
+
+        if self.mismatch is None:
+            self.mismatch = {
+                "record": self.record if record is None else record,
+                "last_id": self.last_id,
+                "expected": balance,
+                "actual": self.balance,
+            }
+            log.warning(
+                "Balance mismatch at record %s (last transaction %s): "
+                "statement reports %s, transactions add up to %s",
+                self.mismatch["record"],
+                self.last_id,
+                balance,
+                self.balance,
+            )
+        return False
+
+    def track(
+        self,
+        parser: StatementParser,
+        records: Iterable[T],
+        offset: Callable[[], Any] | None = None,
+    ) -> Iterator[T]:
+        """Pass records through to the parser, writing a checkpoint every
+        `interval` records. Control returns here only after the parser has
+        handled the yielded record, so a checkpoint always covers it."""
+        for record in records:
+            yield record
+
+            if self.checkpoint_path is None:
+                continue
+            if parser.cur_record - self._checkpointed >= self.interval:
+                self.checkpoint(
+                    parser.cur_record,
+                    parser.statement,
+                    offset() if offset is not None else None,
+                )
+
+    def checkpoint(self, record: int, statement: Statement, offset: Any = None):
+        """Journal lines parsed since the last checkpoint and record progress"""
+        if self.checkpoint_path is None:
+            return
+
+        if self._journal is None:
+            self._journal = open(self.checkpoint_path, "w", encoding="utf-8")
+            self._write({"source": self.source})
+
+        for line in statement.lines[self._journaled :]:
+            self._write(
+                {
+                    "line": dump_fields(
+                        line, LINE_FIELDS, LINE_DECIMAL_FIELDS, LINE_DATE_FIELDS
+                    )
+                }
+            )
+        self._journaled = len(statement.lines)
+
+        mismatch = None
+        if self.mismatch is not None:
+            mismatch = dict(self.mismatch)
+            mismatch["expected"] = str(mismatch["expected"])
+            mismatch["actual"] = str(mismatch["actual"])
+
+        self._write(
+            {
+                "checkpoint": {
+                    "record": record,
+                    "offset": offset,
+                    "balance": None if self.balance is None else str(self.balance),
+                    "last_id": self.last_id,
+                    "mismatch": mismatch,
+                    "statement": dump_fields(
+                        statement,
+                        STATEMENT_FIELDS,
+                        STATEMENT_DECIMAL_FIELDS,
+                        STATEMENT_DATE_FIELDS,
+                    ),
+                }
+            }
+        )
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._checkpointed = record
+
+    def resume(
+        self, statement: Statement, parse_amount: Callable[[str], Any] = Decimal
+    ) -> dict | None:
+        """Restore statement and running balance from the last complete
+        checkpoint. Returns the checkpoint, so the parser can skip records
+        it covers, or None when there is nothing to resume from.
+
+        Amounts and balances are restored with `parse_amount`, so they come
+        back as the same type the parser produces."""
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return None
+
+        checkpoint = None
+        lines: list[dict] = []
+        pending: list[dict] = []
+        end = 0
+
+        with open(self.checkpoint_path, "rb") as f:
+            header = f.readline()
+            try:
+                source = json.loads(header).get("source")
+            except ValueError:
+                source = None
+            if source != self.source:
+                # Keep it, so the other conversion can still be resumed
+                log.warning(
+                    "Checkpoint %s belongs to other input, "
+                    "converting without checkpoints",
+                    self.checkpoint_path,
+                )
+                self.checkpoint_path = None
+                return None
+
+            position = len(header)
+            for raw in f:
+                position += len(raw)
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    # Partially written entry, conversion died here
+                    break
+
+                if "line" in entry:
+                    pending.append(entry["line"])
+                elif "checkpoint" in entry:
+                    lines.extend(pending)
+                    pending = []
+                    checkpoint = entry["checkpoint"]
+                    end = position
+
+        if checkpoint is None:
+            return None
+
+        # Drop anything journaled after the last checkpoint and continue from it
+        with open(self.checkpoint_path, "r+b") as f:
+            f.truncate(end)
+        self._journal = open(self.checkpoint_path, "a", encoding="utf-8")
+
+        load_fields(
+            statement,
+            checkpoint["statement"],
+            STATEMENT_FIELDS,
+            STATEMENT_DECIMAL_FIELDS,
+            STATEMENT_DATE_FIELDS,
+            parse_amount,
+        )
+        for data in lines:
+            line = StatementLine()
+            statement.lines.append(
+                load_fields(
+                    line,
+                    data,
+                    LINE_FIELDS,
+                    LINE_DECIMAL_FIELDS,
+                    LINE_DATE_FIELDS,
+                    parse_amount,
+                )
+            )
+
+        balance = checkpoint["balance"]
+        self.balance = None if balance is None else Decimal(balance)
+        self.record = checkpoint["record"]
+        self.last_id = checkpoint["last_id"]
+        self.mismatch = checkpoint["mismatch"]
+        if self.mismatch is not None:
+            self.mismatch["expected"] = Decimal(self.mismatch["expected"])
+            self.mismatch["actual"] = Decimal(self.mismatch["actual"])
+
+        self._journaled = len(statement.lines)
+        self._checkpointed = self.record
+
+        log.info(
+            "Resuming from checkpoint %s at record %s",
+            self.checkpoint_path,
+            self.record,
+        )
+        return checkpoint
+
+    def finish(self) -> None:
+        """Conversion is done, checkpoint is not needed anymore. Only a
+        checkpoint this run wrote or resumed from is removed, one left by an
+        interrupted conversion of another file is kept."""
+        if self._journal is None:
+            return
+
+        self._journal.close()
+        self._journal = None
+
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _write(self, entry: dict) -> None:
+        assert self._journal is not None, "Checkpoint journal is not open"
+        self._journal.write(json.dumps(entry) + "\n")
+
+
+def from_settings(
+    settings: Mapping[str, Any], source_path: str | None = None
+) -> BalanceReconciler:
+    """Create reconciler from plugin settings:
+
+    checkpoint - path of the checkpoint file, enables resumable conversion
+    checkpoint_interval - number of records between checkpoints
+    """
+    return BalanceReconciler(
+        settings.get("checkpoint"),
+        settings.get("checkpoint_interval", DEFAULT_INTERVAL),
+        source_path,
+    )
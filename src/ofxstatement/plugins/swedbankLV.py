@@ -6,6 +6,7 @@ import logging
 
 from ofxstatement.parser import CsvStatementParser
 from ofxstatement.plugin import Plugin
+from ofxstatement.plugins.reconcileLV import BalanceReconciler, from_settings
 
 LINETYPE_TRANSACTION = "20"
 LINETYPE_STARTBALANCE = "10"
@@ -20,9 +21,25 @@ class SwedbankLVCsvStatementParser(CsvStatementParser):
 
     debug = logging.getLogger().getEffectiveLevel() == logging.DEBUG
 
+    def __init__(self, fin):
+        super(SwedbankLVCsvStatementParser, self).__init__(fin)
+        self.reconciler = BalanceReconciler()
+
+    def parse(self):
+        statement = super(SwedbankLVCsvStatementParser, self).parse()
+        self.reconciler.finish()
+        return statement
+
     def split_records(self):
-        csv_file = csv.reader(self.fin.readlines(), delimiter=";", quotechar='"')
-        return csv_file
+        # Continue right after the last checkpoint, if there is one
+        checkpoint = self.reconciler.resume(self.statement, self.parse_decimal)
+        if checkpoint:
+            self.fin.seek(checkpoint["offset"])
+            self.cur_record = checkpoint["record"]
+
+        # Stream lines with readline, so input position can be stored in checkpoints
+        csv_file = csv.reader(iter(self.fin.readline, ""), delimiter=";", quotechar='"')
+        return self.reconciler.track(self, csv_file, offset=self.fin.tell)
 
     def parse_record(self, line):
         if self.cur_record == 1:
@@ -62,6 +79,8 @@ class SwedbankLVCsvStatementParser(CsvStatementParser):
                 stmtline.date_user = self.parse_datetime(dt)
                 stmtline.check_no = m.group(2)
 
+            self.reconciler.add(self.cur_record, stmtline)
+
             # DEBUG
             if self.debug:
                 print(stmtline, stmtline.trntype)
@@ -71,18 +90,27 @@ class SwedbankLVCsvStatementParser(CsvStatementParser):
         elif lineType == LINETYPE_ENDBALANCE:
             self.statement.end_balance = self.parse_decimal(line[5])
             self.statement.end_date = self.parse_datetime(line[2])
+            self.reconciler.check(self.statement.end_balance, self.cur_record)
 
             # DEBUG
             if self.debug:
                 print("End balance: %s" % self.statement.end_balance)
 
-        elif lineType == LINETYPE_STARTBALANCE and self.statement.start_balance == None:
-            self.statement.start_balance = self.parse_decimal(line[5])
-            self.statement.start_date = self.parse_datetime(line[2])
+        elif lineType == LINETYPE_STARTBALANCE:
+            # Every account or currency block starts with its own balance.
+            # LVL amounts are converted to EUR, so those blocks are not reconciled
+            if line[6] == "LVL":
+                self.reconciler.reset(None)
+            else:
+                self.reconciler.reset(self.parse_decimal(line[5]))
 
-            # DEBUG
-            if self.debug:
-                print("Start balance: %s" % self.statement.start_balance)
+            if self.statement.start_balance == None:
+                self.statement.start_balance = self.parse_decimal(line[5])
+                self.statement.start_date = self.parse_datetime(line[2])
+
+                # DEBUG
+                if self.debug:
+                    print("Start balance: %s" % self.statement.start_balance)
 
 
 class SwedbankLVPlugin(Plugin):
@@ -93,4 +121,5 @@ class SwedbankLVPlugin(Plugin):
         f = open(fin, "r", encoding=encoding)
         parser = SwedbankLVCsvStatementParser(f)
         parser.statement.currency = self.settings.get("currency", "EUR")
+        parser.reconciler = from_settings(self.settings, fin)
         return parser
@@ -2,11 +2,15 @@
 
 import re
 import logging
-from xml.etree import ElementTree
 
 from ofxstatement.parser import StatementParser
 from ofxstatement.plugin import Plugin
 from ofxstatement.statement import Statement, StatementLine
+from ofxstatement.plugins.reconcileLV import (
+    BalanceReconciler,
+    from_settings,
+    iter_fidavista,
+)
 
 
 class SwedbankLVFidavistaStatementParser(StatementParser):
@@ -14,47 +18,48 @@ class SwedbankLVFidavistaStatementParser(StatementParser):
 
     statement = None
     fin = None  # file input stream
+    close_balance = None  # only used for reconciliation
 
     debug = logging.getLogger().getEffectiveLevel() == logging.DEBUG
 
     def __init__(self, fin):
         self.statement = Statement()
         self.fin = fin
+        self.reconciler = BalanceReconciler()
 
-    def split_records(self):
-        xml = ElementTree.parse(self.fin)
-        xml = xml.getroot()
-
-        namespaces = {"ns": xml.tag[1:].partition("}")[0]}
-        statement = xml.find("ns:Statement", namespaces=namespaces)
-
-        if statement == None:
-            raise ValueError(
-                "Cannot find ns:Statement element, is this Fidavista format?"
-            )
-
-        period = statement.find("ns:Period", namespaces=namespaces)
-        self.statement.start_date = self.parse_datetime(
-            period.find("ns:StartDate", namespaces=namespaces).text
-        )
-        self.statement.end_date = self.parse_datetime(
-            period.find("ns:EndDate", namespaces=namespaces).text
-        )
+    def parse(self):
+        statement = super(SwedbankLVFidavistaStatementParser, self).parse()
+        self.reconciler.check(self.close_balance, self.cur_record)
+        self.reconciler.finish()
+        return statement
 
-        account = statement.find("ns:AccountSet", namespaces=namespaces)
-        if not self.statement.account_id:
-            self.statement.account_id = account.find(
-                "ns:AccNo", namespaces=namespaces
-            ).text
-
-        transactions = account.find("ns:CcyStmt", namespaces=namespaces)
-        self.statement.start_balance = self.parse_float(
-            transactions.find("ns:OpenBal", namespaces=namespaces).text
-        )
-
-        all_transactions = transactions.findall("ns:TrxSet", namespaces=namespaces)
-
-        return all_transactions
+    def split_records(self):
+        # Records covered by the last checkpoint are skipped
+        skip = 0
+        checkpoint = self.reconciler.resume(self.statement, self.parse_float)
+        if checkpoint:
+            skip = self.cur_record = checkpoint["record"]
+
+        return self.reconciler.track(self, self.iter_transactions(skip))
+
+    def iter_transactions(self, skip=0):
+        """Stream TrxSet elements, picking up statement details on the way"""
+        for key, element in iter_fidavista(self.fin, skip):
+            if key == "Statement/Period/StartDate":
+                self.statement.start_date = self.parse_datetime(element.text)
+            elif key == "Statement/Period/EndDate":
+                self.statement.end_date = self.parse_datetime(element.text)
+            elif key == "Statement/AccountSet/AccNo":
+                if not self.statement.account_id:
+                    self.statement.account_id = element.text
+            elif key == "Statement/AccountSet/CcyStmt/OpenBal":
+                self.statement.start_balance = self.parse_float(element.text)
+                self.reconciler.start(self.statement.start_balance)
+            elif key == "Statement/AccountSet/CcyStmt/CloseBal":
+                if element.text is not None:
+                    self.close_balance = self.parse_float(element.text)
+            elif key == "Statement/AccountSet/CcyStmt/TrxSet":
+                yield element
 
     def parse_record(self, line):
         # Namespace stuff
@@ -90,6 +95,8 @@ class SwedbankLVFidavistaStatementParser(StatementParser):
             stmt_line.amount = -stmt_line.amount
             stmt_line.trntype = "DEBIT"
 
+        self.reconciler.add(self.cur_record, stmt_line)
+
         # Various types
         if type_code == "CHOU":
             stmt_line.trntype = "ATM"
@@ -116,4 +123,5 @@ class SwedbankLVFiDAViStaPlugin(Plugin):
     def get_parser(self, fin):
         parser = SwedbankLVFidavistaStatementParser(fin)
         parser.statement.currency = self.settings.get("currency", "EUR")
+        parser.reconciler = from_settings(self.settings, fin)
         return parser
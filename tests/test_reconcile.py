@@ -0,0 +1,287 @@
+import os
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from ofxstatement.ui import UI
+from ofxstatement.plugins.citadeleLV import CitadeleLVPlugin
+from ofxstatement.plugins.dnbLV import DnbLVPlugin
+from ofxstatement.plugins.swedbankLV import SwedbankLVPlugin
+from ofxstatement.plugins.swedbankLVFiDAViSta import SwedbankLVFiDAViStaPlugin
+
+CSV_HEADER = (
+    '"Klienta konts";"Ieraksta tips";"Datums";"Saņēmējs/Maksātājs";'
+    '"Informācija saņēmējam";"Summa";"Valūta";"Debets/Kredīts";"Arhīva kods";'
+    '"Maksājuma veids";"Refernces numurs";"Dokumenta numurs";'
+)
+
+
+def csv_balance(linetype: str, amount: str, currency: str = "EUR") -> str:
+    return '"LV01";"%s";"01.01.2020";"";"";"%s";"%s";"K";"";"AS";"";"";' % (
+        linetype,
+        amount,
+        currency,
+    )
+
+
+def csv_transaction(n: int, amount: str = "1,50") -> str:
+    return (
+        '"LV01";"20";"02.01.2020";"Payee %d";"Memo ""%d""";"%s";"EUR";"D";'
+        '"ID%d";"CTX";"";"";' % (n, n, amount, n)
+    )
+
+
+def write_csv(path: Path, count: int = 25, end_balance: str = "62,50") -> str:
+    rows = [CSV_HEADER, csv_balance("10", "100,00")]
+    rows += [csv_transaction(n) for n in range(count)]
+    rows.append(csv_balance("86", end_balance))
+    path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def write_xml(path: Path, count: int = 25, end_balance: str = "60.00") -> str:
+    transactions = "".join(
+        "<TrxSet><TypeCode>OUTP</TypeCode><BookDate>2020-01-02</BookDate>"
+        "<ValueDate>2020-01-02</ValueDate><BankRef>R%d</BankRef><CorD>D</CorD>"
+        "<AccAmt>1.60</AccAmt><PmtInfo>Note %d</PmtInfo></TrxSet>" % (n, n)
+        for n in range(count)
+    )
+    path.write_text(
+        '<?xml version="1.0"?>'
+        '<FIDAVISTA xmlns="http://bankasoc.lv/fidavista/fidavista0101.xsd">'
+        "<Header/><Statement><Period><StartDate>2020-01-01</StartDate>"
+        "<EndDate>2020-01-31</EndDate></Period><AccountSet><AccNo>LV01</AccNo>"
+        "<CcyStmt><Ccy>EUR</Ccy><OpenBal>100.00</OpenBal>"
+        "<CloseBal>%s</CloseBal>%s</CcyStmt></AccountSet></Statement></FIDAVISTA>"
+        % (end_balance, transactions),
+        encoding="utf-8",
+    )
+    return str(path)
+
+
+def get_parser(plugin_cls: Any, filename: str, settings: dict | None = None) -> Any:
+    return plugin_cls(UI(), settings or {}).get_parser(filename)
+
+
+def parse_until(parser: Any, monkeypatch: Any, record: int) -> None:
+    """Parse until given record, where conversion gets killed"""
+    parse_record = parser.parse_record
+
+    def killed(line: Any) -> Any:
+        if parser.cur_record == record:
+            raise KeyboardInterrupt()
+        return parse_record(line)
+
+    monkeypatch.setattr(parser, "parse_record", killed)
+    with pytest.raises(KeyboardInterrupt):
+        parser.parse()
+
+
+def dump_lines(statement: Any) -> list:
+    return [
+        (line.id, line.date, line.memo, line.amount, type(line.amount), line.trntype)
+        for line in statement.lines
+    ]
+
+
+def test_csv_resume_matches_full_run(tmp_path: Path, monkeypatch: Any) -> None:
+    filename = write_csv(tmp_path / "statement.csv")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "5"}
+
+    expected = get_parser(SwedbankLVPlugin, filename).parse()
+
+    parse_until(get_parser(SwedbankLVPlugin, filename, settings), monkeypatch, 19)
+    assert os.path.exists(checkpoint)
+
+    parser = get_parser(SwedbankLVPlugin, filename, settings)
+    statement = parser.parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+    assert statement.start_balance == Decimal("100.00")
+    assert statement.end_balance == Decimal("62.50")
+    assert parser.reconciler.mismatch is None
+
+
+def test_resume_keeps_parser_amount_type(tmp_path: Path, monkeypatch: Any) -> None:
+    filename = write_xml(tmp_path / "statement.xml")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "4"}
+
+    expected = get_parser(DnbLVPlugin, filename).parse()
+
+    parse_until(get_parser(DnbLVPlugin, filename, settings), monkeypatch, 15)
+    statement = get_parser(DnbLVPlugin, filename, settings).parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+    assert all(isinstance(line.amount, float) for line in statement.lines)
+
+
+@pytest.mark.parametrize("plugin_cls", [SwedbankLVFiDAViStaPlugin, CitadeleLVPlugin])
+def test_fidavista_resume_matches_full_run(
+    tmp_path: Path, monkeypatch: Any, plugin_cls: Any
+) -> None:
+    filename = write_xml(tmp_path / "statement.xml")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "4"}
+
+    expected = get_parser(plugin_cls, filename).parse()
+
+    parse_until(get_parser(plugin_cls, filename, settings), monkeypatch, 15)
+    parser = get_parser(plugin_cls, filename, settings)
+    statement = parser.parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+    assert statement.start_balance == expected.start_balance
+    assert parser.reconciler.mismatch is None
+
+
+def test_resume_after_partially_written_entry(tmp_path: Path, monkeypatch: Any) -> None:
+    filename = write_csv(tmp_path / "statement.csv")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "5"}
+
+    expected = get_parser(SwedbankLVPlugin, filename).parse()
+
+    parse_until(get_parser(SwedbankLVPlugin, filename, settings), monkeypatch, 19)
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write('{"line": {"id": "ID99", "amo')
+
+    parser = get_parser(SwedbankLVPlugin, filename, settings)
+    statement = parser.parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+    assert parser.reconciler.mismatch is None
+
+
+def test_checkpoint_from_other_source_is_ignored(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    other = write_csv(tmp_path / "other.csv", count=30, end_balance="55,00")
+    filename = write_csv(tmp_path / "statement.csv")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "5"}
+
+    parse_until(get_parser(SwedbankLVPlugin, other, settings), monkeypatch, 24)
+    assert os.path.exists(checkpoint)
+
+    expected = get_parser(SwedbankLVPlugin, filename).parse()
+    statement = get_parser(SwedbankLVPlugin, filename, settings).parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+
+    # Checkpoint of the other file is kept, so it still can be resumed
+    assert os.path.exists(checkpoint)
+    expected = get_parser(SwedbankLVPlugin, other).parse()
+    statement = get_parser(SwedbankLVPlugin, other, settings).parse()
+
+    assert dump_lines(statement) == dump_lines(expected)
+    assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_removed_after_finish(tmp_path: Path) -> None:
+    filename = write_xml(tmp_path / "statement.xml")
+    checkpoint = str(tmp_path / "checkpoint")
+    settings = {"checkpoint": checkpoint, "checkpoint_interval": "4"}
+
+    parser = get_parser(SwedbankLVFiDAViStaPlugin, filename, settings)
+    parser.parse()
+
+    assert len(parser.statement.lines) == 25
+    assert not os.path.exists(checkpoint)
+
+
+def test_mismatch_on_closing_balance_line(tmp_path: Path) -> None:
+    filename = write_csv(tmp_path / "statement.csv", end_balance="60,00")
+
+    parser = get_parser(SwedbankLVPlugin, filename)
+    parser.parse()
+
+    assert parser.reconciler.mismatch == {
+        "record": 28,
+        "last_id": "ID24",
+        "expected": Decimal("60.00"),
+        "actual": Decimal("62.50"),
+    }
+
+
+def test_mismatch_on_close_bal(tmp_path: Path) -> None:
+    filename = write_xml(tmp_path / "statement.xml", end_balance="61.00")
+
+    parser = get_parser(SwedbankLVFiDAViStaPlugin, filename)
+    parser.parse()
+
+    assert parser.reconciler.mismatch is not None
+    assert parser.reconciler.mismatch["last_id"] == "R24"
+    assert parser.reconciler.mismatch["expected"] == Decimal("61.00")
+    assert parser.reconciler.mismatch["actual"] == Decimal("60.00")
+
+
+@pytest.mark.parametrize(
+    "plugin_cls", [SwedbankLVFiDAViStaPlugin, DnbLVPlugin, CitadeleLVPlugin]
+)
+def test_fidavista_statement_is_valid(tmp_path: Path, plugin_cls: Any) -> None:
+    filename = write_xml(tmp_path / "statement.xml")
+
+    parser = get_parser(plugin_cls, filename)
+    statement = parser.parse()
+    statement.assert_valid()
+
+    assert parser.reconciler.mismatch is None
+
+
+@pytest.mark.parametrize(
+    "plugin_cls", [SwedbankLVFiDAViStaPlugin, DnbLVPlugin, CitadeleLVPlugin]
+)
+def test_fidavista_empty_close_bal(tmp_path: Path, plugin_cls: Any) -> None:
+    filename = write_xml(tmp_path / "statement.xml", end_balance="")
+
+    parser = get_parser(plugin_cls, filename)
+    statement = parser.parse()
+
+    assert len(statement.lines) == 25
+    assert parser.reconciler.mismatch is None
+
+
+def test_fidavista_only_first_currency_statement(tmp_path: Path) -> None:
+    filename = write_xml(tmp_path / "statement.xml")
+    path = Path(filename)
+    second = (
+        "<CcyStmt><Ccy>USD</Ccy><OpenBal>5.00</OpenBal><CloseBal>4.00</CloseBal>"
+        "<TrxSet><TypeCode>OUTP</TypeCode><BookDate>2020-01-02</BookDate>"
+        "<ValueDate>2020-01-02</ValueDate><BankRef>USD1</BankRef><CorD>D</CorD>"
+        "<AccAmt>1.00</AccAmt><PmtInfo>Note</PmtInfo></TrxSet></CcyStmt>"
+    )
+    path.write_text(
+        path.read_text(encoding="utf-8").replace("</CcyStmt>", "</CcyStmt>" + second),
+        encoding="utf-8",
+    )
+
+    parser = get_parser(SwedbankLVFiDAViStaPlugin, filename)
+    statement = parser.parse()
+
+    assert len(statement.lines) == 25
+    assert "USD1" not in [line.id for line in statement.lines]
+    assert parser.reconciler.mismatch is None
+
+
+def test_csv_blocks_reconciled_separately(tmp_path: Path) -> None:
+    rows = [CSV_HEADER, csv_balance("10", "100,00")]
+    rows += [csv_transaction(n) for n in range(2)]
+    rows.append(csv_balance("86", "97,00"))
+    rows.append(csv_balance("10", "10,00"))
+    rows.append(csv_transaction(2, "2,00"))
+    rows.append(csv_balance("86", "8,00"))
+    rows.append(csv_balance("10", "50,00", "LVL"))
+    rows.append(csv_balance("86", "40,00", "LVL"))
+    filename = tmp_path / "statement.csv"
+    filename.write_text("\n".join(rows) + "\n", encoding="utf-8")
+
+    parser = get_parser(SwedbankLVPlugin, str(filename))
+    statement = parser.parse()
+
+    assert len(statement.lines) == 3
+    assert statement.start_balance == Decimal("100.00")
+    assert parser.reconciler.mismatch is None